@@ -1,9 +1,34 @@
 #!/usr/bin/env python3
 import re
 import os
+import csv
 import json
+import mmap
 
-from collections import OrderedDict
+from collections import OrderedDict, namedtuple
+
+
+#------------------------------------------------------------------------------#
+
+SECTION_REGEX = re.compile('^[ \t]*[/][A-Z0-9]+["]', flags=re.M | re.I)
+GROUP_REGEX = re.compile('([^"]+)"[^\n]*(.*)', flags=re.DOTALL)
+
+FILENAME_REGEX = re.compile(b"^[ \t]*[*]{4,}[^*\n]+[*]{4,}", flags=re.M)
+NAME_TRIM_REGEX = re.compile("(^[* ]+)|([ *]+$)")
+
+ALIAS_REGEX = re.compile('(.*?)[ \t]*[[](.*)[]]')
+CALL_ARGS_REGEX = re.compile("[(](.*)[)]")
+QUOTE_TRIM_REGEX = re.compile('^[\'"](.*)[\'"]$')
+PAREN_TRIM_REGEX = re.compile("[(].*[)]")
+
+DOCREF_TRIM_REGEX = re.compile("^[A-Za-z0-9]+[ \t]+", flags=re.M)
+
+# One row of the parsed _index.txt table. Field names follow the notes at
+# the bottom of this file; integer indexing still works like the old
+# plain tuples did.
+Entry = namedtuple("Entry", ["cmd", "description", "type", "docref",
+                             "target", "unknown_numeric"])
+HELP_BLOCK_REGEX = re.compile("^(G[0-9]+)[ \t]+H[ \t]+", flags=re.M)
 
 
 #------------------------------------------------------------------------------#
@@ -17,11 +42,8 @@ def read_syntax_file():
     data = open('practice.uew').read()
     completions = {}
 
-    section_regex = re.compile('^[ \t]*[/][A-Z0-9]+["]', flags=re.M | re.I)
-    group_regex = re.compile('([^"]+)"[^\n]*(.*)', flags=re.DOTALL)
-
-    for section in re.split(section_regex, data)[1:]:
-        groups = re.match(group_regex, section).groups()
+    for section in re.split(SECTION_REGEX, data)[1:]:
+        groups = re.match(GROUP_REGEX, section).groups()
 
         name = groups[0]
         section = groups[1].strip()
@@ -40,13 +62,15 @@ def read_syntax_file():
     parameters = []
 
     for line in completions.pop('Format Opt Param'):
-        if line[0:1] == "%":
+        first = line[0:1]
+
+        if first == "%":
             fattributes.append(line)
 
         elif line[0:2] == "//":
             options.append(line[0:2].strip())
 
-        elif re.match("[a-z0-9]", line, flags=re.I):
+        elif first.isascii() and first.isalnum():
             parameters.append(line)
 
     completions['FAttributes'] = fattributes
@@ -61,20 +85,24 @@ def read_syntax_file():
 def load_helpfiles():
     """ Read the Trace32 helpfile, taken from t32/help.t32. Split it into
     the subfiles that make it up, and return a dict containing all of
-    help.t32's component files. """
-
-    data = open('help.t32').read()
+    help.t32's component files. The file is scanned through an mmap, so
+    only the slice for each subfile gets copied/decoded. """
 
-    filename_regex = re.compile("^[ \t]*[*]{4,}[^*\n]+[*]{4,}", flags=re.M)
-    matches = [x for x in re.finditer(filename_regex, data)]
-    start_points = [x.start() for x in matches] + [len(data)]
     helpfiles = OrderedDict()
 
-    for index in range(len(start_points)-1):
-        text = data[start_points[index]:start_points[index+1]]
-        match_length = matches[index].end() - matches[index].start()
-        name = re.sub("(^[* ]+)|([ *]+$)", "", matches[index].group())
-        helpfiles[name] = text[match_length:].strip() + "\n"
+    with open('help.t32', 'rb') as infile:
+        data = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+
+        matches = [x for x in re.finditer(FILENAME_REGEX, data)]
+        start_points = [x.start() for x in matches] + [len(data)]
+
+        for index in range(len(start_points)-1):
+            text = data[start_points[index]:start_points[index+1]].decode()
+            match_length = matches[index].end() - matches[index].start()
+            name = NAME_TRIM_REGEX.sub("", matches[index].group().decode())
+            helpfiles[name] = text[match_length:].strip() + "\n"
+
+        data.close()
 
     return helpfiles
 
@@ -95,32 +123,58 @@ def parse_index(helpfiles):
     """ Parse a 'helpfiles' object, and split it into a list of 'entries'
     object (which is expected by other functions in this file). """
 
-    lines = [x.strip() for x in helpfiles['_index.txt'].strip().splitlines()]
-    lines = [x for x in lines if x]
-    entries = [x.split('","') for x in lines]
-    result = [tuple([x[0][1:]] + x[1:5] + [x[5][:-1]]) for x in entries]
-    return tuple(result)
+    lines = (x.strip() for x in helpfiles['_index.txt'].strip().splitlines())
+    reader = csv.reader(x for x in lines if x)
+    return tuple(Entry(*fields[0:6]) for fields in reader)
 
 
 #------------------------------------------------------------------------------#
 
 
+_ENTRY_INDEXES = {}
+
+def _field_index(field, entries):
+    """ Return a dict that maps every value of 'field' onto the list of
+    entries carrying that value. Indexes are cached per entries-object, so
+    repeated filter/fuzz calls don't rescan the whole table. """
+
+    key = (id(entries), field)
+    cached = _ENTRY_INDEXES.get(key)
+
+    if cached is not None and cached[0] is entries:
+        return cached[1]
+
+    index = {}
+    for entry in entries:
+        index.setdefault(entry[field], []).append(entry)
+
+    _ENTRY_INDEXES[key] = (entries, index)
+    return index
+
 def ffuzz_entries(field, value, entries):
     """ Take an 'entries' object and return all entries that have a field
     that matches the value of 'value'. """
 
-    return [x for x in entries if value.lower() in x[field].lower()]
+    value = value.lower()
+    index = _field_index(field, entries)
+
+    result = []
+    for key in index:
+        if value in key.lower():
+            result.extend(index[key])
+
+    return result
 
 def show_values(field, entries):
     """ Return all unique values of a field in 'entries'. """
 
-    return sorted(set([x[field] for x in entries]))
+    return sorted(_field_index(field, entries))
 
 def filter_entries(field, value, entries):
     """ Return all entries in 'entries' where 'value' has an exact match
     in the right field of the entry. """
 
-    return [x for x in entries if x[field] == value]
+    return list(_field_index(field, entries).get(value, ()))
 
 #------------------------------------------------------------------------------#
 
@@ -134,15 +188,15 @@ def load_functions(entries):
     functions = OrderedDict()
 
     for entry in filter_entries(2, 'function', entries):
-        match = re.search('(.*?)[ \t]*[[](.*)[]]', entry[0])
+        match = re.search(ALIAS_REGEX, entry[0])
         alias, syntax = match.groups()
 
-        args = re.search("[(](.*)[)]", syntax).groups()[0].split(",")
+        args = re.search(CALL_ARGS_REGEX, syntax).groups()[0].split(",")
         if args == ['']:
             args = []
 
-        args = [re.sub('^[\'"](.*)[\'"]$','\\1', x) for x in args]
-        fullname = re.sub("[(].*[)]", "", syntax)
+        args = [QUOTE_TRIM_REGEX.sub('\\1', x) for x in args]
+        fullname = PAREN_TRIM_REGEX.sub("", syntax)
         docref = entry[3]
 
         record = functions.get(fullname)
@@ -179,7 +233,7 @@ def load_commands(entries, helpfiles):
         cdesc = entry[0]
         docref = entry[3]
 
-        match = re.search('(.*?)[ \t]*[[](.*)[]]', cdesc)
+        match = re.search(ALIAS_REGEX, cdesc)
         if match:
             alias, fullname = match.groups()
             if " " in alias:
@@ -203,21 +257,13 @@ def load_commands(entries, helpfiles):
         commands[name]['aliases'] = tuple(sorted(commands[name]['aliases']))
         commands[name]['docrefs'] = tuple(sorted(commands[name]['docrefs']))
 
+    helpstring_index = _index_helpstrings(helpfiles)
+
     for command in commands:
         helpstrings = set()
 
         for docref in commands[command]["docrefs"]:
-            regex = re.escape(docref) + "[ \t]+H[ \t]+.*?(?=^G[0-9]+[ \t]+H)"
-            regex = re.compile(regex, flags=re.M | re.DOTALL)
-
-            for docname in helpfiles:
-                matches = re.findall(regex, helpfiles[docname])
-                if not matches:
-                    continue
-
-                assert len(matches) == 1
-                help = re.sub("^[A-Za-z0-9]+[ \t]+", "", matches[0], flags=re.M)
-                helpstrings.add(help.strip() + "\n")
+            helpstrings.update(helpstring_index.get(docref, ()))
 
         helpstrings = tuple(sorted(helpstrings))
         commands[command]['helpstrings'] = helpstrings
@@ -225,6 +271,25 @@ def load_commands(entries, helpfiles):
     return commands
 
 
+def _index_helpstrings(helpfiles):
+    """ Scan each helpfile exactly once, and index every help block by its
+    docref. Replaces the old approach of re-scanning every helpfile for
+    each docref of each command. """
+
+    blocks = {}
+
+    for docname in helpfiles:
+        text = helpfiles[docname]
+        matches = [x for x in re.finditer(HELP_BLOCK_REGEX, text)]
+
+        for index, match in enumerate(matches[:-1]):
+            body = text[match.start():matches[index + 1].start()]
+            help = DOCREF_TRIM_REGEX.sub("", body)
+            blocks.setdefault(match.group(1), set()).add(help.strip() + "\n")
+
+    return blocks
+
+
 #------------------------------------------------------------------------------#
 
 
@@ -240,17 +305,16 @@ def generate_json():
     functions = load_functions(entries)
     commands = load_commands(entries, helpfiles)
 
-    with open('helpfiles.json', "w") as outfile:
-        outfile.write(json.dumps(helpfiles, indent=2))
-
-    with open('entries.json', "w") as outfile:
-        outfile.write(json.dumps(entries, indent=2))
-
-    with open('functions.json', "w") as outfile:
-        outfile.write(json.dumps(functions, indent=2))
+    outputs = {
+        'helpfiles.json': helpfiles,
+        'entries.json': entries,
+        'functions.json': functions,
+        'commands.json': commands
+    }
 
-    with open('commands.json', "w") as outfile:
-        outfile.write(json.dumps(commands, indent=2))
+    for filename in outputs:
+        with open(filename, "w") as outfile:
+            json.dump(outputs[filename], outfile, separators=(',', ':'))
 
 
 #------------------------------------------------------------------------------#
@@ -1,17 +1,41 @@
 """ Module for wrapping Trace32 into an easier-to-automate interface. """
 
-from .t32run import Trace32Subprocess, Podbus, usb_reset
-from .t32run import find_trace32_bin, find_trace32_dir
+import importlib
 
-from .t32iface import Trace32Interface, ScriptFailure
-from .t32api import ApiError, CallFailure, CommandFailure
-from .t32api import EvalError
+# Map of public names to the submodule that provides each one. Submodules
+# are imported lazily (PEP 562) the first time one of their names is
+# touched, which keeps 'import trace32_cli' cheap at CLI startup.
 
-from .trace32_cli import main
+_EXPORTS = {
+    'Trace32Subprocess': 't32run',
+    'Podbus': 't32run',
+    'usb_reset': 't32run',
+    'find_trace32_bin': 't32run',
+    'find_trace32_dir': 't32run',
 
-# pylint: disable=undefined-variable
-del t32run
-del trace32_cli
-del t32api
-del t32api_errors
-del common
+    'Trace32Interface': 't32iface',
+    'ScriptFailure': 't32iface',
+
+    'ApiError': 't32api',
+    'CallFailure': 't32api',
+    'CommandFailure': 't32api',
+    'EvalError': 't32api',
+
+    'main': 'trace32_cli',
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    """ Resolves public names out of their submodules on first use. """
+
+    if name in _EXPORTS:
+        module = importlib.import_module("." + _EXPORTS[name], __name__)
+        return getattr(module, name)
+
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
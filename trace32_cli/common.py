@@ -7,6 +7,7 @@ import tempfile
 import atexit
 import sys
 import signal
+import traceback
 
 
 def delete_path(path):
@@ -35,26 +36,51 @@ def make_tempdir():
     return tempfile.TemporaryDirectory()
 
 
+# Registered cleanups, as [function, args, kwargs, called-flag] entries.
+# They all share one atexit entry and one excepthook wrapper (installed on
+# first use), so repeated register_cleanup() calls don't stack nested hooks.
+
+_CLEANUPS = []
+_ORIGINAL_EXCEPTHOOK = None
+
+
+def _run_cleanups():
+    """ Runs every registered cleanup that hasn't already fired, newest
+    first (matching atexit's last-in-first-out ordering). Failures are
+    reported and skipped, so one raising cleanup can't starve the rest. """
+
+    for entry in reversed(_CLEANUPS):
+        if not entry[3]:
+            entry[3] = True
+
+            try:
+                entry[0](*entry[1], **entry[2])
+            # pylint: disable=broad-except
+            except Exception:
+                sys.stderr.write(f"Error in cleanup {entry[0]!r}:\n")
+                traceback.print_exc()
+
+
+def _cleanup_excepthook(exception_type, value, traceback):
+    # pylint: disable=missing-docstring
+    _run_cleanups()
+    return _ORIGINAL_EXCEPTHOOK(exception_type, value, traceback)
+
+
 def register_cleanup(function, *args, **kwargs):
     """ Registers a function with atexit and the system exception handler.
     Function will be called once at exit, regardless of whether the exit was
     intentional or not. """
+    # pylint: disable=global-statement
 
-    def cleanup():
-        # pylint: disable=missing-docstring
-        if not cleanup.called:
-            function(*args, **kwargs)
-            cleanup.called = True
-
-    cleanup.called = False
-    atexit.register(cleanup)
-    old_hook = sys.excepthook
+    global _ORIGINAL_EXCEPTHOOK
 
-    def new_hook(exception_type, value, traceback):
-        cleanup()
-        return old_hook(exception_type, value, traceback)
+    if _ORIGINAL_EXCEPTHOOK is None:
+        _ORIGINAL_EXCEPTHOOK = sys.excepthook
+        sys.excepthook = _cleanup_excepthook
+        atexit.register(_run_cleanups)
 
-    sys.excepthook = new_hook
+    _CLEANUPS.append([function, args, kwargs, False])
 
 
 def register_handler(signum, function, *args, **kwargs):
@@ -16,6 +16,12 @@ from .t32api_errors import Errcode
 # is intended to verify that t32api_errors.py was created correctly.
 assert len(Errcode) > 1
 
+# Value-to-member map for O(1) errcode lookups. confirm_success runs as
+# the errcheck hook on every DLL call, so scanning the (large, generated)
+# enum linearly there is off the table.
+_ERRCODE_MAP = {int(x): x for x in Errcode}
+_ERRCODE_OK = int(Errcode.OK)
+
 # --------------------------------------------------------------------------- #
 
 
@@ -29,12 +35,8 @@ class ApiError(Exception):
         if isinstance(errcode, Errcode):
             self.errcode = errcode
         else:
-            matches = [x for x in Errcode if x == int(errcode)]
-
-            if matches:
-                self.errcode = matches[0]
-            else:
-                self.errcode = int(errcode)
+            errcode = int(errcode)
+            self.errcode = _ERRCODE_MAP.get(errcode, errcode)
 
     def __str__(self):
         err_msg = f"Function '{self.funcname}' returned nonzero status of "
@@ -155,6 +157,23 @@ class ResultType(enum.IntEnum):
     BitMask = 0x4000
     Empty = 0x8000
 
+
+# Precomputed views of the enums above, so that the hot wrapper methods
+# don't re-walk an enum on every call.
+_ATTACH_VALUES = frozenset(x.value for x in AttachType)
+_ATTACH_ICD_INT = int(AttachType.ICD)
+
+# Accepted T32_Config keys, mapped (in both bare and '=' forms) to their
+# normalized form. A dict hit replaces the per-call upper/strip/membership
+# dance for well-formed keys.
+_CONFIG_KEYS = {}
+
+for _key in ('NODE', 'PACKLEN', 'PORT', 'TIMEOUT', 'HOSTPORT'):
+    _CONFIG_KEYS[_key] = _key + '='
+    _CONFIG_KEYS[_key + '='] = _key + '='
+_RESULT_MAP = {x.value: x for x in ResultType}
+_MSG_TYPE_ITEMS = tuple((x.value, x) for x in MessageType if x.value)
+
 # --------------------------------------------------------------------------- #
 
 
@@ -165,20 +184,25 @@ class StringConverter:
     # pylint: disable=too-few-public-methods
 
     @staticmethod
-    def from_param(data):
+    def from_param(data, _char_p=ctypes.c_char_p):
         """ Converts 'data' to a bytes instance. Stringifies it first, if
-        necessary. """
+        necessary. ctypes invokes this for every string argument of every
+        wrapped call, so the common types are dispatched on exact type
+        instead of chained isinstance checks, and c_char_p is bound as a
+        default argument to skip the global lookup. """
+
+        cls = type(data)
 
-        if isinstance(data, bytearray):
-            data = bytes(data)
+        if cls is bytes:
+            return _char_p(data)
 
-        if not isinstance(data, bytes):
-            data = str(data)
+        if cls is str:
+            return _char_p(data.encode('ascii'))
 
-        if isinstance(data, str):
-            data = data.encode('ascii')
+        if cls is bytearray:
+            return _char_p(bytes(data))
 
-        return ctypes.c_char_p(data)
+        return _char_p(str(data).encode('ascii'))
 
 
 def confirm_success(result, func, args=None):
@@ -186,20 +210,19 @@ def confirm_success(result, func, args=None):
     an error otherwise. Intended to commonize error-detection across all
     wrapped functions. """
 
-    if int(result) == Errcode.OK:
-        return Errcode(int(result))
+    result = int(result)
+
+    if result == _ERRCODE_OK:
+        return Errcode.OK
 
     # Note on this: From api_remote_c.pdf, Lauterbach states that negative
     # values are reserved for communication/library errors, and positive
     # values are reserved for failed commands and the like.
 
-    if int(result) in list(Errcode):
-        errcode = Errcode(int(result))
+    errcode = _ERRCODE_MAP.get(result, result)
 
-        if errcode.value < 0:
-            raise CommunicationError(func.__name__, errcode)
-    else:
-        errcode = int(result)
+    if isinstance(errcode, Errcode) and (errcode.value < 0):
+        raise CommunicationError(func.__name__, errcode)
 
     arg_strings = []
 
@@ -221,49 +244,86 @@ def _dll_init_generic(dll):
     """ Configure the basic ctypes wrappers of the "Generic API functions"
     imported from the Trace32 CAPI. Note only a subset is wrapped. """
 
-    function_list = [
-        'T32_Config', 'T32_Init', 'T32_Exit', 'T32_Attach',
-        'T32_Nop', 'T32_Ping', 'T32_Cmd', 'T32_ExecuteCommand',
-        'T32_ExecuteFunction', 'T32_Stop', 'T32_EvalGet', 'T32_EvalGetString',
-        'T32_GetMessageString', 'T32_Terminate', 'T32_GetPracticeState',
-        'T32_ResetCPU', 'T32_Break'
-    ]
+    # Every wrapped function shares the same restype/errcheck, so the
+    # prototypes only differ by argtypes. Each function gets configured
+    # exactly once; nothing is assigned and then overwritten.
+
+    prototypes = {
+        'T32_Config': (StringConverter, StringConverter),
+        'T32_Init': (),
+        'T32_Exit': (),
+        'T32_Attach': (ctypes.c_int,),
+        'T32_Nop': (),
+        'T32_Ping': (),
+        'T32_Cmd': (StringConverter,),
+
+        'T32_ExecuteCommand': (
+            StringConverter,
+            ctypes.POINTER(ctypes.c_char),
+            ctypes.c_uint32
+        ),
 
-    for name in function_list:
+        'T32_ExecuteFunction': (
+            StringConverter,
+            ctypes.POINTER(ctypes.c_char),
+            ctypes.c_uint32,
+            ctypes.POINTER(ctypes.c_uint32)
+        ),
+
+        'T32_Stop': (),
+        'T32_EvalGet': (ctypes.POINTER(ctypes.c_uint32),),
+        'T32_EvalGetString': (ctypes.POINTER(ctypes.c_char),),
+
+        'T32_GetMessageString': (
+            ctypes.POINTER(ctypes.c_char),
+            ctypes.c_uint16,
+            ctypes.POINTER(ctypes.c_uint16),
+            ctypes.POINTER(ctypes.c_uint16)
+        ),
+
+        'T32_Terminate': (ctypes.c_int,),
+        'T32_GetPracticeState': (ctypes.POINTER(ctypes.c_int),),
+        'T32_ResetCPU': (),
+        'T32_Break': ()
+    }
+
+    for name, argtypes in prototypes.items():
         function = dll.__getattr__(name)
-        function.argtypes = ()
+        function.argtypes = argtypes
         function.restype = ctypes.c_int
         function.errcheck = confirm_success
 
-    dll.T32_Config.argtypes = (StringConverter, StringConverter)
-    dll.T32_Attach.argtypes = (ctypes.c_int,)
-    dll.T32_Cmd.argtypes = (StringConverter,)
-
-    dll.T32_ExecuteCommand.argtypes = (
-        StringConverter,
+    memory_argtypes = (
+        ctypes.c_size_t,
+        ctypes.c_uint8,
         ctypes.POINTER(ctypes.c_char),
-        ctypes.c_uint32
+        ctypes.c_int
     )
 
-    dll.T32_ExecuteFunction.argtypes = (
-        StringConverter,
-        ctypes.POINTER(ctypes.c_char),
-        ctypes.c_uint32,
-        ctypes.POINTER(ctypes.c_uint32)
-    )
+    for name in ('read_memory', 'write_memory'):
+        function = dll.__getattr__(name)
+        function.argtypes = memory_argtypes
+        function.restype = ctypes.c_int
+        function.errcheck = confirm_success
 
-    dll.T32_EvalGet.argtypes = (ctypes.POINTER(ctypes.c_uint32),)
-    dll.T32_EvalGetString.argtypes = (ctypes.POINTER(ctypes.c_char),)
+    return dll
 
-    dll.T32_GetMessageString.argtypes = (
-        ctypes.POINTER(ctypes.c_char),
-        ctypes.c_uint16,
-        ctypes.POINTER(ctypes.c_uint16),
-        ctypes.POINTER(ctypes.c_uint16)
-    )
 
-    dll.T32_Terminate.argtypes = (ctypes.c_int,)
-    dll.T32_GetPracticeState.argtypes = (ctypes.POINTER(ctypes.c_int),)
+_DLL_CACHE = {}
+
+
+def _load_dll(libfile):
+    """ Load the CAPI library and configure all of its prototypes.
+    Configured handles are cached per path: dlopen refcounts repeated
+    loads of the same library anyway, so re-running the symbol lookups
+    and prototype setup for every Trace32API instance was pure
+    overhead. """
+
+    dll = _DLL_CACHE.get(libfile)
+
+    if dll is None:
+        dll = _dll_init_generic(ctypes.cdll.LoadLibrary(libfile))
+        _DLL_CACHE[libfile] = dll
 
     return dll
 
@@ -273,48 +333,42 @@ class Trace32API:
     argument management, standardized error-checking, etc. """
     # pylint: disable=invalid-name
 
-    def __init__(self, libfile=None):
+    def __init__(self, libfile=None, bufsize=2**16):
         if libfile is None:
             script_dir = os.path.abspath(os.path.dirname(__file__))
             libfile = os.path.join(script_dir, "_t32api.so")
 
-        libfile = os.path.abspath(libfile)
-        self.dll = ctypes.cdll.LoadLibrary(libfile)
-        self.dll = _dll_init_generic(self.dll)
+        self.dll = _load_dll(os.path.abspath(libfile))
 
-        self.dll.read_memory.restype = ctypes.c_int
-        self.dll.read_memory.errcheck = confirm_success
-        self.dll.read_memory.argtypes = (
-            ctypes.c_size_t,
-            ctypes.c_uint8,
-            ctypes.POINTER(ctypes.c_char),
-            ctypes.c_int
-        )
-
-        self.dll.write_memory.argtypes = ()
-        self.dll.write_memory.restype = ctypes.c_int
-        self.dll.write_memory.errcheck = confirm_success
-        self.dll.write_memory.argtypes = (
-            ctypes.c_size_t,
-            ctypes.c_uint8,
-            ctypes.POINTER(ctypes.c_char),
-            ctypes.c_int
-        )
+        # Scratch storage shared by the wrapper methods below. Allocating
+        # (and zero-filling) a fresh buffer on every call is a measurable
+        # cost on chatty paths like eval/command loops, so one set gets
+        # allocated up front and reused without re-zeroing. This makes each
+        # API instance non-reentrant, but the underlying remote protocol is
+        # strictly serial anyway. The default 64kB matches the largest
+        # response Trace32 will produce; callers that only ever make small
+        # requests can pass a smaller bufsize.
+
+        self._bufsize = bufsize
+        self._buffer = ctypes.create_string_buffer(bufsize)
+        self._msg_type = ctypes.c_uint16(0)
+        self._msg_len = ctypes.c_uint16(0)
+        self._restype = ctypes.c_uint32(0)
 
     def T32_Config(self, key, value):
         """ Sets $key to $value in the trace32 DLL. Used for setting up
         communication parameters before calling T32_Start(). Known parameters
         include: NODE, PACKLEN, PORT, TIMEOUT, HOSTPORT. """
 
-        key = key.upper()
+        full_key = _CONFIG_KEYS.get(key)
 
-        if key.endswith("="):
-            key = key[:-1]
+        if full_key is None:
+            full_key = _CONFIG_KEYS.get(key.upper().rstrip('='))
 
-        if key not in ('NODE', 'PACKLEN', 'PORT', 'TIMEOUT', 'HOSTPORT'):
+        if full_key is None:
             raise ValueError(f"Invalid key '{key}' for T32_Config")
 
-        self.dll.T32_Config(key + '=', value)
+        self.dll.T32_Config(full_key, value)
 
     def T32_Init(self):
         """ Initializes the driver and connects to Trace32. Should be
@@ -327,7 +381,11 @@ class Trace32API:
         """ Attaches to an initialized T32 session. Should be called
         immediately after T32_Init(). """
 
-        if device not in (x.value for x in AttachType):
+        if device is AttachType.ICD:
+            self.dll.T32_Attach(_ATTACH_ICD_INT)
+            return
+
+        if device not in _ATTACH_VALUES:
             raise ValueError(f"Invalid device '{device}' for T32_Attach")
 
         self.dll.T32_Attach(int(device))
@@ -363,10 +421,15 @@ class Trace32API:
         """ Retrieves a message-string created by a PRACTICE command. Returns
         the string, as well as any type-hints associated with it."""
 
-        msg_type = ctypes.c_uint16(0)
-        msg_len = ctypes.c_uint16(0)
-        buffer = ctypes.create_string_buffer(2**16)
-        self.dll.T32_GetMessageString(buffer, 2**16 - 1, msg_type, msg_len)
+        msg_type = self._msg_type
+        msg_len = self._msg_len
+        msg_type.value = 0
+        msg_len.value = 0
+
+        buffer = self._buffer
+        buffer[0] = b'\x00'
+        self.dll.T32_GetMessageString(buffer, self._bufsize - 1,
+                                      msg_type, msg_len)
 
         msg_type = msg_type.value
         msg_len = msg_len.value
@@ -377,9 +440,12 @@ class Trace32API:
         if buffer[msg_len - 1:msg_len] == b'\x00':
             msg_len -= 1
 
-        # pylint: disable=consider-using-generator
-        types = tuple([x for x in MessageType if int(x.value) & msg_type])
-        msg = buffer.value.decode("ascii")
+        # The DLL already reported the message length, so the string gets
+        # sliced out directly instead of re-scanning the 64kB buffer for
+        # its NUL terminator via .value.
+
+        types = tuple(x for value, x in _MSG_TYPE_ITEMS if value & msg_type)
+        msg = buffer.raw[0:msg_len].decode("ascii")
         return {"msg": msg, "types": types}
 
     def T32_EvalGet(self):
@@ -395,7 +461,8 @@ class Trace32API:
         specific PRACTICE commands such as EVAL. There is potentially some
         overlap with messages reported on T32_GetMessageString. """
 
-        buffer = ctypes.create_string_buffer(2**16)
+        buffer = self._buffer
+        buffer[0] = b'\x00'
         self.dll.T32_EvalGetString(buffer)
         return buffer.value.decode("ascii")
 
@@ -421,11 +488,12 @@ class Trace32API:
         response message (if any). DO commands will return immediately, and all
         other kinds of commands will block until they're completed. """
 
-        buffer = ctypes.create_string_buffer(2**16)
+        buffer = self._buffer
+        buffer[0] = b'\x00'
         call_failure = None
 
         try:
-            self.dll.T32_ExecuteCommand(cmd, buffer, 2**16 - 1)
+            self.dll.T32_ExecuteCommand(cmd, buffer, self._bufsize - 1)
         except CallFailure as err:
             call_failure = err
 
@@ -441,11 +509,14 @@ class Trace32API:
         """ Evaluate a TRACE32 expression/command. Return the resulting
         buffer, as well as its reported result-type. """
 
-        buff = ctypes.create_string_buffer(2**16)
-        restype = ctypes.c_uint32(0)
+        buff = self._buffer
+        buff[0] = b'\x00'
+        restype = self._restype
+        restype.value = 0
         error = False
         try:
-            self.dll.T32_ExecuteFunction(expression, buff, 2**16 - 1, restype)
+            self.dll.T32_ExecuteFunction(expression, buff,
+                                         self._bufsize - 1, restype)
         except CallFailure:
             error = True
 
@@ -453,13 +524,15 @@ class Trace32API:
             result = buff.value.decode('latin-1')
             raise EvalError(result, expression)
 
-        if restype.value not in (x.value for x in ResultType):
+        restype = _RESULT_MAP.get(restype.value, restype)
+
+        if not isinstance(restype, ResultType):
             err_msg = f"result-type [{restype}] from T32_ExecuteFunction"
             err_msg += " is unknown."
             raise ValueError(err_msg)
 
         buff = buff.value.decode("ascii")
-        return {"msg": buff, "type": ResultType(restype.value)}
+        return {"msg": buff, "type": restype}
 
     def T32_Stop(self):
         """ Stop a currently-running PRACTICE script. """
@@ -5,11 +5,13 @@ for interfacing with TRACE32. """
 
 import ctypes
 import os
-import re
 import time
+import select
 import tempfile
 import random
+import string
 import multiprocessing as mp
+import threading
 import sys
 
 
@@ -20,6 +22,30 @@ from .common import register_cleanup, make_tempdir
 # --------------------------------------------------------------------------- #
 
 
+def _decode_binary(msg):
+    """ Decode a Trace32 binary literal (0y prefix, optional ! suffix). """
+
+    if msg.endswith("!"):
+        msg = msg[:-1]
+
+    if msg.startswith("0y"):
+        msg = msg[2:]
+
+    return int(msg, 2)
+
+
+# Handlers for decoding T32_ExecuteFunction results, keyed by result
+# type. Booleans are handled separately, and types without a handler
+# pass their message through untouched.
+
+EVAL_DECODERS = {
+    ResultType.Hexadecimal: lambda msg: int(msg, 16),
+    ResultType.Binary: _decode_binary,
+    ResultType.Decimal: lambda msg: int(msg.rstrip("."), 10),
+    ResultType.Float: float,
+}
+
+
 class ScriptFailure(Exception):
     """ Exception class used to report that a PRACTICE script failed. Contains
     the failing script, and also some data about the error. """
@@ -37,42 +63,102 @@ def until_keyword(file_obj, keyword, maxblock=None, poll_rate=None):
     """ Calls $file_obj.read() repeatedly (with an adjustable polling rate).
     Retreives and yields as much data as possible, until $keyword is
     encountered. Intended to be used to fetch all of file_obj's data up until
-    (but not including) $keyword. """
+    (but not including) $keyword. Only a tail short enough to still be a
+    partial keyword is held between reads, so every search runs over a small
+    bounded window rather than the whole accumulated stream. """
 
     buffer = type(file_obj.read(0))()
     assert isinstance(keyword, type(buffer))
 
-    # the longest match is dropped because it's tested single-case.
-    keychunks = [keyword[0:k] for k in range(1, len(keyword) + 1)]
-    keychunks = keychunks[-2::-1]
+    # When the source has a real descriptor, idle waits go through select
+    # (bounded by poll_rate) so fresh data wakes the loop immediately
+    # instead of finishing out a sleep tick.
+    fileno = file_obj.fileno() if hasattr(file_obj, "fileno") else None
+
+    # The last len(keyword)-1 characters are always held back between
+    # reads: anything older can't be part of a future match, and a single
+    # find() over tail-plus-block covers every split the old per-prefix
+    # endswith() chain used to handle.
+    keep = len(keyword) - 1
 
-    # the longest match is dropped because it's tested single-case.
     yield buffer[0:0]
 
     while True:
         block = file_obj.read(maxblock)
-        buffer = buffer + block
-        index = buffer.find(keyword)
+
+        if not block:
+            # Nothing new arrived. The retained tail is too short to hold
+            # the keyword on its own, so there's nothing to search or emit:
+            # just wait for more data.
+            if poll_rate is not None:
+                if fileno is not None:
+                    select.select([fileno], [], [], poll_rate)
+                else:
+                    time.sleep(poll_rate)
+            continue
+
+        window = buffer + block
+        index = window.find(keyword)
 
         if index != -1:
-            yield buffer[0:index]
+            yield window[0:index]
             break
 
-        for keychunk in keychunks:
-            if buffer.endswith(keychunk):
-                yield buffer[0:-len(keychunk)]
-                buffer = keychunk
-                break
-        else:
-            yield buffer
-            buffer = buffer[0:0]
+        cut = len(window) - keep
 
-        if poll_rate is not None:
-            time.sleep(poll_rate)
+        if cut > 0:
+            yield window[0:cut]
+            buffer = window[cut:]
+        else:
+            buffer = window
 
 # --------------------------------------------------------------------------- #
 
 
+class _FifoReader:
+    """ Minimal unbuffered reader for the nonblocking AREA FIFO. Reads go
+    straight through os.read() on the raw descriptor, so there's no
+    interpreter-level buffering to spin through (or to get stale data
+    stuck in) when the FIFO is drained. """
+
+    def __init__(self, fileno):
+        self._fd = fileno
+
+    def read(self, size=None):
+        """ Read and decode whatever the FIFO has pending, up to 'size'
+        bytes. Returns an empty string when nothing is available. """
+
+        if size is None:
+            size = 2**16
+
+        try:
+            block = os.read(self._fd, size)
+        except BlockingIOError:
+            return ''
+
+        return block.decode('latin-1')
+
+    def fileno(self):
+        """ Return the underlying descriptor (for select-style waits). """
+        return self._fd
+
+    def drain(self):
+        """ Discard everything currently pending in the FIFO. Reads use
+        pipe-capacity-sized chunks, so an already-empty FIFO (the common
+        case) costs a single syscall. """
+
+        while True:
+            try:
+                if not os.read(self._fd, 2**16):
+                    return
+            except BlockingIOError:
+                return
+
+    def close(self):
+        """ Close the underlying descriptor. """
+        os.close(self._fd)
+
+
 class Trace32Interface:
     """ High-level Trace32 interface that provides better-integrated functions
     for running commands and/or scripts, and evaluating literals. The interface
@@ -99,11 +185,15 @@ class Trace32Interface:
         else:
             self.tempdir = tempdir
 
+        self._read_buffer = None
+        self._area_selected = False
+        self._cmd_area_clear = None
+
         fifo_name = os.path.join(self.tempdir, "area.fifo")
         os.mkfifo(fifo_name)
         fileno = os.open(fifo_name, os.O_RDONLY | os.O_NONBLOCK)
-        self.fifo = os.fdopen(fileno, 'r')
-        self.fifo.read(4096)
+        self.fifo = _FifoReader(fileno)
+        self.fifo.drain()
         self.fifo_name = fifo_name
         self.node = node
         self.port = port
@@ -155,8 +245,11 @@ class Trace32Interface:
 
         self._connect_lowlevel(timeout)
 
-        name = [chr(random.randint(ord('A'), ord('Z'))) for _ in range(8)]
-        self.area = ''.join(name)
+        self.area = ''.join(random.choices(string.ascii_uppercase, k=8))
+
+        # Pre-encoded so the hot clear_area path hands the DLL wrapper
+        # bytes directly, skipping the per-call ASCII encode.
+        self._cmd_area_clear = f"AREA.CLEAR {self.area}".encode('ascii')
 
         # The geometry of this window was experimentally determined by hunting
         # around. Trace32 doesn't let you make an infinite-sized window, but
@@ -171,12 +264,13 @@ class Trace32Interface:
             f"AREA.Select {self.area}"
         ]
 
-        while self.fifo.read(4096):
-            pass
+        self.fifo.drain()
 
         for cmd in cmds:
             self.api.T32_Cmd(cmd)
 
+        self._area_selected = True
+
     def _connect_lowlevel(self, timeout=10):
         """ Connect to a Trace32 instance. """
 
@@ -212,6 +306,11 @@ class Trace32Interface:
             self.api.T32_Config("PACKLEN=", self.packlen)
 
         init_ok = False
+        delay = 0.01
+
+        # Retry with exponential backoff (capped at 250ms): each failed
+        # T32_Init is a full DLL call plus an exception, so hammering it
+        # every 10ms through a slow startup just burns cycles.
 
         while True:
             if time.time() > timeout_time:
@@ -223,7 +322,8 @@ class Trace32Interface:
                 break
             except CommunicationError as err:
                 last_exception = err
-                time.sleep(0.01)
+                time.sleep(delay)
+                delay = min(delay * 2, 0.25)
 
         if not init_ok:
             raise last_exception
@@ -234,21 +334,6 @@ class Trace32Interface:
         self.api.T32_Ping()
         self.connected = True
 
-    def _reconnect(self):
-        """ Reconnect to a preconfigured to a Trace32 instance. """
-
-        self.api.T32_Config("NODE=", self.node)
-        self.api.T32_Config("PORT=", self.port)
-
-        if self.packlen:
-            self.api.T32_Config("PACKLEN=", self.packlen)
-
-        self.api.T32_Init()
-        self.api.T32_Attach()
-        self.api.T32_Ping()
-
-        self.connected = True
-
     def disconnect(self, shutdown=False, exit_code=None):
         """ Disconnect from a Trace32 instance. """
 
@@ -272,6 +357,7 @@ class Trace32Interface:
 
         self.api.T32_Exit()
         self.connected = False
+        self._area_selected = False
 
     def ping(self):
         """ Checks to make sure that the API is connected and active. """
@@ -280,7 +366,9 @@ class Trace32Interface:
     def read_memory(self, address, length, address_width=None):
         """ Reads a block of data from the target's memory-space and
         returns it. Set address_width to 32 or 64 for an explicit value,
-        or else it'll be auto-determined. """
+        or else it'll be auto-determined. The receive buffer is reused
+        between calls, so repeated same-sized reads (e.g. bulk dumps)
+        don't reallocate per block. """
 
         if address_width is None:
             if address >= 2**32:
@@ -288,9 +376,14 @@ class Trace32Interface:
             else:
                 address_width = 32
 
-        buffer = ctypes.create_string_buffer(length)
+        buffer = self._read_buffer
+
+        if (buffer is None) or (len(buffer) < length):
+            buffer = ctypes.create_string_buffer(length)
+            self._read_buffer = buffer
+
         self.api.dll.read_memory(address, address_width, buffer, length)
-        return buffer.raw
+        return buffer.raw[0:length]
 
     def write_memory(self, address, data, address_width=None):
         """ Writes a block of data to the target's memory-space. Set
@@ -311,121 +404,116 @@ class Trace32Interface:
         FIFO (which is connected to that AREA). Set the message-string to
         a detectable flag-value, and return that value. """
 
-        self.api.T32_Cmd(f"AREA.CLEAR {self.area}")
-        self.api.T32_Cmd(f"AREA.Select {self.area}")
-        while self.fifo.read(4096):
-            pass
+        self.api.T32_Cmd(self._cmd_area_clear)
+
+        # The AREA stays selected for the life of the connection, so the
+        # re-select only happens if something dropped it. Every skipped
+        # command is one less DLL round-trip per run_command/eval cycle.
+
+        if not self._area_selected:
+            self.api.T32_Cmd(f"AREA.Select {self.area}")
+            self._area_selected = True
+
+        self.fifo.drain()
 
-        chars = [chr(random.randint(ord('A'), ord('Z'))) for _ in range(16)]
-        flag_message = f"Semaphore {''.join(chars)}"
+        chars = ''.join(random.choices(string.ascii_uppercase, k=16))
+        flag_message = f"Semaphore {chars}"
         self.api.T32_Cmd(f'Print %AREA A000 "{flag_message}"')
         message_string = self.api.T32_GetMessageString()
         assert message_string['msg'] == flag_message
         return flag_message
 
     @staticmethod
-    def _wait_idle(libfile, node, port, packlen):
-        """ Creates a new API instance and uses it to poll the
-        T32_GetPracticeState function.  Blocks until T32_GetPracticeState()
-        returns Idle. This function is intended to be used in a background
-        thread/process, while the main API is disconnected. """
+    def _validate_script(scriptfile, script=None):
+        """ Sanity-check a PRACTICE script before running it. Callers that
+        already hold the script text can pass it in to skip re-reading the
+        file from disk. """
 
-        api = Trace32API(libfile)
-        api.T32_Config("NODE=", node)
-        api.T32_Config("PORT=", port)
-        if packlen:
-            api.T32_Config("PACKLEN=", packlen)
+        if script is None:
+            with open(scriptfile) as infile:
+                script = infile.read()
 
-        api.T32_Init()
+        # Only the final statement matters here, so the lines get walked
+        # from the end (skipping blanks and comments) instead of
+        # comment-stripping and rebuilding the entire script.
 
-        try:
-            while True:
-                practice_state = api.T32_GetPracticeState()
-                if practice_state == PracticeState.Idle:
-                    break
+        for line in reversed(script.splitlines()):
+            line = line.strip()
 
-                time.sleep(0.01)
-        except KeyboardInterrupt:
-            pass
+            if line and not line.startswith(";"):
+                if line.startswith("ENDDO"):
+                    return
+                break
 
-        api.T32_Exit()
+        err_msg = "Error: %s is missing final ENDDO statement."
+        raise ValueError(err_msg % scriptfile)
 
-    @staticmethod
-    def _validate_script(scriptfile):
-        """ Sanity-check a PRACTICE script before running it. """
-        script = open(scriptfile).read().strip()
-        lines = re.sub("^[ \t]*;.*?$", "", script, flags=re.M).splitlines()
-        lines = [x.strip() for x in lines]
-        lines = [x for x in lines if x]
-
-        if not lines[-1].startswith("ENDDO"):
-            err_msg = "Error: %s is missing final ENDDO statement."
-            raise ValueError(err_msg % scriptfile)
-
-    def run_file(self, scriptfile, args=(), logfile=None):
-        """ Run a PRACTICE script that exists on the filesystem. """
-
-        buffer = ""
-        self._validate_script(scriptfile)
+    def run_file(self, scriptfile, args=(), logfile=None, script=None):
+        """ Run a PRACTICE script that exists on the filesystem. 'script'
+        optionally carries the file's text for callers (like run_script)
+        that already have it in memory. """
+
+        scriptfile = os.path.abspath(scriptfile)
+        self._validate_script(scriptfile, script)
         msgline_flag = self.clear_area()
 
-        cmd = f"DO {os.path.abspath(scriptfile)}"
+        cmd = f"DO {scriptfile}"
         if args:
             cmd += " " + " ".join(args)
 
         self.api.T32_ExecuteCommand(cmd)
 
-        # A background task is used to poll Trace32 and wait until the script
-        # exits. This allows us to continue retrieving FIFO data while the
-        # script runs, and is necessary because some Trace32 operations can
-        # block its ability to respond to API calls.
-
-        # To accomplish this, the main API is shut down with T32_Exit() so that
-        # it's available to the background task. Then, it's re-initialized
-        # after the background task is completed.
-
-        self.api.T32_Exit()
-        self.connected = False
-        caught_exception = None
-
-        args = (self.libfile, self.node, self.port, self.packlen)
-        proc = mp.Process(target=self._wait_idle, args=args, daemon=True)
-        proc.start()
+        # While the script runs, its AREA output has to be drained
+        # continuously (a full FIFO would stall the script), and Trace32 has
+        # to be polled to detect the script's exit. Some Trace32 operations
+        # block its ability to respond to API calls, so the state poll can
+        # stall for a while -- the draining therefore runs in a background
+        # thread, which is pure os.read() work and never touches the API.
+        # The main connection stays up the whole time; the old
+        # T32_Exit()/reconnect dance around every script is gone.
+
+        chunks = []
+        errors = []
+        done = threading.Event()
+
+        def _drain_to_log():
+            # pylint: disable=broad-except,missing-docstring
+            try:
+                while True:
+                    output = self.fifo.read(4096)
+
+                    if output:
+                        if logfile:
+                            logfile.write(output)
+                        chunks.append(output)
+                    elif done.is_set():
+                        break
+                    else:
+                        select.select([self.fifo.fileno()], [], [], 0.025)
+            except Exception as err:
+                errors.append(err)
+
+        reader = threading.Thread(target=_drain_to_log, daemon=True)
+        reader.start()
 
         try:
-            while True:
-                output = self.fifo.read(4096)
-                if logfile:
-                    logfile.write(output)
-                buffer += output
-
-                if not proc.is_alive():
-                    break
-
-                time.sleep(0.025)
-
-        # pylint: disable=broad-except
-        except Exception as err:
-            caught_exception = err
-
-        # At the conclusion of proc.is_alive(), Trace32 has reported that the
-        # script is finished (or there was an abnormal exit of some kind).
-        # The proc is expliticly terminated as a just-in-case, and then the API
-        # is re-initialized.
+            while self.api.T32_GetPracticeState() != PracticeState.Idle:
+                time.sleep(0.01)
+        finally:
+            done.set()
+            reader.join()
 
-        proc.terminate()
-        self._reconnect()
+        if errors:
+            raise errors[0]
 
-        if caught_exception:
-            raise caught_exception
+        self.api.T32_Ping()
 
         # After running the script, a random string is generated and printed
         # to the Trace32 AREA. This flag is then detected using until_keyword()
         # as a reliable means to make sure that we've captured all of the
         # script's output data.
 
-        flag = [chr(random.randint(ord('A'), ord('Z'))) for _ in range(16)]
-        flag = "".join(flag)
+        flag = ''.join(random.choices(string.ascii_uppercase, k=16))
         self.api.T32_Cmd(f'PRINT %AREA {self.area} "{flag}"')
 
         for chunk in until_keyword(self.fifo, flag, maxblock=4096,
@@ -433,10 +521,15 @@ class Trace32Interface:
             if logfile:
                 logfile.write(chunk)
 
-            buffer += chunk
+            chunks.append(chunk)
+
+        self.fifo.drain()
+
+        # Output is accumulated as a list of chunks and joined once, which
+        # keeps long captures linear instead of rebuilding an ever-growing
+        # string per chunk.
 
-        while self.fifo.read(4096):
-            pass
+        buffer = "".join(chunks)
 
         message_string = self.api.T32_GetMessageString()
         if message_string['msg'] != msgline_flag:
@@ -450,10 +543,10 @@ class Trace32Interface:
     def run_script(self, script, args=(), logfile=None):
         """ Run a PRACTICE script supplied as a string. """
 
-        lines = re.sub("^;.*?$", "", script.strip(), flags=re.M).splitlines()
-        lines = [x.strip() for x in lines]
+        last_line = script.strip().rsplit("\n", 1)[-1]
 
-        if not lines[-1].startswith("ENDDO"):
+        if last_line.startswith(";") or \
+                not last_line.strip().startswith("ENDDO"):
             script = script + "\nENDDO"
 
         script = script.strip() + "\n"
@@ -462,7 +555,8 @@ class Trace32Interface:
             outfile.write(script)
             outfile.flush()
             try:
-                return self.run_file(outfile.name, args=args, logfile=logfile)
+                return self.run_file(outfile.name, args=args,
+                                     logfile=logfile, script=script)
             except ScriptFailure as err:
                 err.script = script
                 raise err
@@ -472,26 +566,22 @@ class Trace32Interface:
         the result to a logfile as its received. """
 
         msgline_flag = self.clear_area()
-        while self.fifo.read(4096):
-            pass
-
         self.api.T32_ExecuteCommand(cmd)
 
-        flag = [chr(random.randint(ord('A'), ord('Z'))) for _ in range(16)]
-        flag = "".join(flag)
+        flag = ''.join(random.choices(string.ascii_uppercase, k=16))
         self.api.T32_Cmd(f'PRINT %AREA {self.area} "{flag}"')
 
         fetcher = until_keyword(self.fifo, flag, maxblock=4096,
                                 poll_rate=0.05)
-        buffer = ""
+        chunks = []
         for chunk in fetcher:
             if logfile:
                 logfile.write(chunk)
 
-            buffer += chunk
+            chunks.append(chunk)
 
-        while self.fifo.read(4096):
-            pass
+        buffer = "".join(chunks)
+        self.fifo.drain()
 
         if logfile:
             if len(buffer) > 1 and buffer[-1] != '\n':
@@ -516,35 +606,23 @@ class Trace32Interface:
         """ Decode the result from a call to T32_ExecuteFunction() into a
         Python literal. """
 
+        msg = result['msg']
+
         if result['type'] == ResultType.Boolean:
-            if result['msg'].lower() in ["true", "true()", "1"]:
+            if msg.lower() in ("true", "true()", "1"):
                 return True
 
-            if result['msg'].lower() in ["false", "false()", "0"]:
+            if msg.lower() in ("false", "false()", "0"):
                 return False
 
-            err_msg = f"Unknown mapping from [{result['msg']}] to bool."
-            raise ValueError(err_msg)
+            raise ValueError(f"Unknown mapping from [{msg}] to bool.")
 
-        if result['type'] == ResultType.Hexadecimal:
-            result = int(result['msg'], 16)
+        decoder = EVAL_DECODERS.get(result['type'])
 
-        elif result['type'] == ResultType.Binary:
-            msg = re.sub("[!]$", "", result['msg'])
-            msg = re.sub("^(0y){0,1}", "0b", msg)
-            result = int(msg, 2)
-
-        elif result['type'] == (ResultType.Decimal):
-            msg = re.sub("[.]$", "", result['msg'])
-            result = int(msg, 10)
-
-        elif result['type'] == (ResultType.Float):
-            result = float(result['msg'])
-
-        else:
-            result = result['msg']
+        if decoder is None:
+            return msg
 
-        return result
+        return decoder(msg)
 
     def eval_expression(self, expression, decode=True, logfile=None):
         """ Run a single command and return the result. Optionally, also write
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
-""" Provides a Trace32 class that runs the actual Trace32 binary in a polled
-loop and provides Queue-based stdin/stdout/stderr/ctrl communication with the
-loop. """
+""" Provides a Trace32 class that runs the actual Trace32 binary in a
+subprocess and provides thread-serviced stdin/stdout/stderr communication
+with it. """
 
 import queue
 import enum
@@ -12,9 +12,9 @@ import sys
 import socket
 import typing
 import platform
-import glob
 import time
 import threading
+import functools
 import multiprocessing as mp
 import re
 
@@ -23,6 +23,28 @@ from .t32api import Trace32API, CommunicationError
 
 # --------------------------------------------------------------------------- #
 
+# The host platform can't change mid-run, and platform.architecture() can
+# be surprisingly slow (it shells out to 'file' on some systems), so both
+# probes are done once at import time.
+
+_PLATNAME = platform.system().lower()
+_IS_64 = "64" in str(platform.architecture()[0])
+
+_SYSDIR_CHOICES = [os.path.join(os.path.expanduser("~"), "t32")]
+
+if "windows" in _PLATNAME:
+    _SYSDIR_CHOICES += ["C:\\T32", "C:\\t32"]
+else:
+    _SYSDIR_CHOICES += ["/opt/t32", "/usr/local/t32"]
+
+# Popen keywords that detach the Trace32 subprocess from our process group,
+# so terminal signals (like Ctrl-C) don't reach it directly.
+
+if hasattr(sp, "CREATE_NEW_PROCESS_GROUP"):
+    _POPEN_DETACH = {"creationflags": sp.CREATE_NEW_PROCESS_GROUP}
+else:
+    _POPEN_DETACH = {"start_new_session": True}
+
 
 def _add_doc(value):
     """ Decorator that adds a docstring to a function. """
@@ -32,10 +54,13 @@ def _add_doc(value):
     return _doc
 
 
+@functools.lru_cache(maxsize=None)
 def find_trace32_dir(trace32_bin=None):
     """ Finds the install directory for Trace32. Checks to see if 'trace32_bin'
     is in the system PATH, and derives the install directory from that if
-    possible. Otherwise, $HOME/t32 and /opt/t32 are checked in that order. """
+    possible. Otherwise, $HOME/t32 and /opt/t32 are checked in that order.
+    Results are cached, since the install won't move mid-run and the search
+    stats a fair number of paths. """
 
     if trace32_bin:
         trace32_executable = shutil.which(trace32_bin)
@@ -50,37 +75,38 @@ def find_trace32_dir(trace32_bin=None):
 
                 dirname = os.path.abspath(os.path.join(dirname, ".."))
 
-    sysdir_choices = [os.path.join(os.path.expanduser("~"), "t32")]
-
-    if "windows" in platform.system().lower():
-        sysdir_choices.append("C:\\T32")
-        sysdir_choices.append("C:\\t32")
-    else:
-        sysdir_choices.append("/opt/t32")
-        sysdir_choices.append("/usr/local/t32")
-
-    for dirname in sysdir_choices:
+    for dirname in _SYSDIR_CHOICES:
         if os.path.exists(os.path.join(dirname, "version.t32")):
             return os.path.abspath(dirname)
 
     raise ValueError("Couldn't find Trace32 install directory.")
 
 
+@functools.lru_cache(maxsize=None)
 def find_trace32_bin(target, install_dir):
     """ Finds the right trace32 executable for your target bin. If pointed
     at a multi-OS install, the right OS is chosen based on the Python
     interpeter being used. Tries an exact match, but can also pick up -qt
-    variants if an exact match isn't found. """
+    variants if an exact match isn't found. Results are cached per
+    (target, install_dir), which spares repeat spawns the directory walk. """
 
-    platname = platform.system().lower()
+    platname = _PLATNAME
     if "windows" in platname and target.endswith(".exe"):
         target = target[:-4]
 
-    glob_frag = f"bin/*/{target}*".replace("/", os.sep)
-    glob_pattern = os.path.join(os.path.abspath(install_dir), glob_frag)
-    matches = glob.glob(glob_pattern)
-    match_dirs = [os.path.basename(os.path.dirname(x)) for x in matches]
-    bin_platforms = sorted(set(match_dirs))
+    bin_root = os.path.join(os.path.abspath(install_dir), "bin")
+
+    try:
+        subdirs = sorted(x.name for x in os.scandir(bin_root) if x.is_dir())
+    except OSError:
+        subdirs = []
+
+    bin_platforms = []
+
+    for subdir in subdirs:
+        with os.scandir(os.path.join(bin_root, subdir)) as entries:
+            if any(x.name.startswith(target) for x in entries):
+                bin_platforms.append(subdir)
 
     if "darwin" in platname:
         bin_platforms = [x for x in bin_platforms if "mac" in x]
@@ -91,7 +117,7 @@ def find_trace32_bin(target, install_dir):
     elif "solaris" in platname:
         bin_platforms = [x for x in bin_platforms if "suns" in x]
 
-    if "64" in str(platform.architecture()[0]):
+    if _IS_64:
         bin_platforms = [x for x in bin_platforms if "64" in x]
     else:
         bin_platforms = [x for x in bin_platforms if "64" not in x]
@@ -101,13 +127,21 @@ def find_trace32_bin(target, install_dir):
         raise OSError(msg)
 
     bindir = os.path.join(install_dir, "bin", bin_platforms[0])
-    glob_pattern = os.path.join(bindir, f"{target}*")
+    suffix = ".exe" if "windows" in platname else ""
+
+    matches = []
+
+    for entry in os.scandir(bindir):
+        if not entry.name.startswith(target):
+            continue
 
-    if "windows" in platname:
-        glob_pattern += ".exe"
+        if suffix and not entry.name.endswith(suffix):
+            continue
 
-    matches = glob.glob(glob_pattern)
-    matches = sorted([x for x in matches if shutil.which(x)])
+        if entry.is_file() and os.access(entry.path, os.X_OK):
+            matches.append(entry.path)
+
+    matches.sort()
     if not matches:
         msg = f"Couldn't find executable with name {target} in {bindir}."
         raise OSError(msg)
@@ -128,11 +162,15 @@ class ThreadedPopen(sp.Popen):
     def __init__(self, *args, **kwargs):
         self._shutdown = False
         self._threads = []
+        # stdout/stderr accumulate into persistent bytearrays: the service
+        # threads extend them in place (one memcpy per chunk), and a drain
+        # snapshots and clears the whole buffer in one shot. stdin stays a
+        # Queue because its service thread blocks in get().
+        self._buf_lock = threading.Lock()
         self._queues = {
-            'ctrl': queue.Queue(),
             'stdin': queue.Queue(),
-            'stdout': queue.Queue(),
-            'stderr': queue.Queue()
+            'stdout': bytearray(),
+            'stderr': bytearray()
         }
 
         kwargs['stdin'] = sp.PIPE
@@ -141,13 +179,16 @@ class ThreadedPopen(sp.Popen):
         kwargs['bufsize'] = 0
 
         super().__init__(*args, **kwargs)
-        self._buftype = type(self.stdout.read(0))
 
-        args = (self.stdout, self._queues['stdout'], "read")
+        # The stream type is already decided by the Popen arguments, so
+        # there's no need to probe it with a read() on the fresh pipe.
+        self._buftype = str if self.text_mode else bytes
+
+        args = (self.stdout, self._queues['stdout'], "read", self._buf_lock)
         thread = threading.Thread(target=self._service_pipe, args=args)
         self._threads.append(thread)
 
-        args = (self.stderr, self._queues['stderr'], "read")
+        args = (self.stderr, self._queues['stderr'], "read", self._buf_lock)
         thread = threading.Thread(target=self._service_pipe, args=args)
         self._threads.append(thread)
 
@@ -198,42 +239,60 @@ class ThreadedPopen(sp.Popen):
         return result
 
     @staticmethod
-    def _service_pipe(iopipe, ioqueue, direction):
+    def _service_pipe(iopipe, ioqueue, direction, lock=None):
         if direction == "read":
+            # Drain with os.read on the raw fd, which skips BufferedReader's
+            # per-call lock and readahead copy. A zero-length read means the
+            # write end closed: stop servicing instead of spinning on EOF.
+            fileno = iopipe.fileno()
+
             while True:
                 try:
-                    data = iopipe.read(2**16)
-                    ioqueue.put(data)
+                    data = os.read(fileno, 2**16)
                 # pylint: disable=broad-except
                 except Exception:
                     break
 
+                if not data:
+                    break
+
+                with lock:
+                    ioqueue.extend(data)
+
         elif direction == "write":
+            # Coalesce whatever queued up behind the first block, so a burst
+            # of small write_stdin() calls costs a single write syscall.
             while True:
                 try:
                     data = ioqueue.get()
                     ioqueue.task_done()
+
+                    while True:
+                        try:
+                            data = data + ioqueue.get_nowait()
+                            ioqueue.task_done()
+                        except queue.Empty:
+                            break
+
                     iopipe.write(data)
                 # pylint: disable=broad-except
                 except Exception:
                     break
 
-    def _read_queue(self, ioqueue):
-        """ Reads all blocks of data from one of the internal ioqueues, joins
-        them together, and returns the result. """
+    def _read_buffer(self, iobuffer):
+        """ Atomically takes everything accumulated in one of the internal
+        stream buffers, and returns it as a single block. """
 
-        blocks = []
-        try:
-            while True:
-                if ioqueue.empty():
-                    break
+        with self._buf_lock:
+            data = bytes(iobuffer)
+            iobuffer.clear()
 
-                blocks.append(ioqueue.get_nowait())
-                ioqueue.task_done()
-        except queue.Empty:
-            pass
+        if self._buftype is str:
+            # The service threads always collect raw bytes; text-mode
+            # streams get decoded once here, at the drain boundary.
+            return data.decode(self.encoding or "latin-1")
 
-        return self._buftype().join(blocks)
+        return data
 
     def write_stdin(self, data):
         """ Writes a block of data to the Trace32 subprocess. Can be called
@@ -245,13 +304,13 @@ class ThreadedPopen(sp.Popen):
         """ Gets all data waiting in the Trace32 subprocess's stdout queue,
         and returns it as a single string. """
 
-        return self._read_queue(self._queues['stdout'])
+        return self._read_buffer(self._queues['stdout'])
 
     def read_stderr(self):
         """ Gets all data waiting in the Trace32 subprocess's stderr queue,
         and returns it as a single string. """
 
-        return self._read_queue(self._queues['stderr'])
+        return self._read_buffer(self._queues['stderr'])
 
 
 class Podbus(enum.Enum):
@@ -262,6 +321,31 @@ class Podbus(enum.Enum):
     USB = enum.auto()
 
 
+# Pre-stripped fragments of the Trace32 config file. _genconfig() picks the
+# relevant ones and fills the placeholders with a single format_map pass.
+
+_CONFIG_BASE = """\
+OS=
+SYS={t32dir}
+TMP={tmpdir}
+
+RCL=NETTCP
+PORT={port}"""
+
+_CONFIG_HEADLESS = """\
+SCREEN=OFF
+MOUSE=OFF
+KEY=OFF
+SOUND=OFF"""
+
+_CONFIG_USB = """\
+PBI=
+USB
+CONNECTIONMODE=AUTOCONNECT"""
+
+_CONFIG_SIM = "PBI=SIM"
+
+
 class Trace32Subprocess:
     """ Class for running Trace32 in a subprocess, and communicating with its
     stdin/stdout/stderr via queues. This class can be used as a 'with'
@@ -284,8 +368,17 @@ class Trace32Subprocess:
         self.podbus = podbus
         self.libfile = libfile
 
-        with open(self.config_file, "w") as outfile:
-            outfile.write(self._genconfig(gui, podbus))
+        # Written through the raw fd: skips the TextIOWrapper/encoder stack,
+        # keeps the file (which names our RCL port) at 0o600, and O_CLOEXEC
+        # makes sure the fd can't leak into the Trace32 subprocess.
+        flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC
+        flags |= getattr(os, "O_CLOEXEC", 0)
+
+        fd = os.open(self.config_file, flags, 0o600)
+        try:
+            os.write(fd, self._genconfig(gui, podbus).encode("ascii"))
+        finally:
+            os.close(fd)
 
     @staticmethod
     def _api_quit(libfile, port):
@@ -317,11 +410,11 @@ class Trace32Subprocess:
             args = (self.libfile, self.port)
             proc = mp.Process(target=self._api_quit, args=args, daemon=True)
             proc.start()
-            timeout = time.time() + 1
+            timeout = time.monotonic() + 1
 
             while proc.is_alive():
                 time.sleep(0.01)
-                if time.time() > timeout:
+                if time.monotonic() > timeout:
                     break
 
             if proc.exitcode == 0:
@@ -331,13 +424,13 @@ class Trace32Subprocess:
                 proc.terminate()
                 timeout = 0.25
 
-            timeout = time.time() + timeout
+            timeout = time.monotonic() + timeout
             while True:
                 if self.popen.poll() is not None:
                     return
 
                 time.sleep(0.01)
-                if time.time() > timeout:
+                if time.monotonic() > timeout:
                     break
 
         self.stop(0.25)
@@ -353,6 +446,11 @@ class Trace32Subprocess:
         socktype = socket.SOCK_STREAM
         temp_socket = socket.socket(socket.AF_INET, socktype)
 
+        # REUSEADDR must be set before bind() to have any effect on this
+        # socket. It lets Trace32 take the port over as soon as the dummy
+        # reservation closes, even if the old binding lingers in TIME_WAIT.
+        temp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
         try:
             temp_socket.bind(('', port))
         except (OSError, PermissionError):
@@ -363,51 +461,24 @@ class Trace32Subprocess:
             sys.stderr.write(f"Error: {err_msg}\n")
             sys.exit(1)
 
-        temp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         port = int(temp_socket.getsockname()[1])
         return (port, temp_socket)
 
     def _genconfig(self, gui: bool, podbus: Podbus):
-        config = """
-        OS=
-        SYS=@T32DIR@
-        TMP=@TMPDIR@
-
-        RCL=NETTCP
-        PORT=@PORT@
-        """
+        parts = [_CONFIG_BASE]
+
         if not gui:
-            config += """
-            SCREEN=OFF
-            MOUSE=OFF
-            KEY=OFF
-            SOUND=OFF
-            """
-
-        if podbus == Podbus.USB:
-            config += """
-            PBI=
-            USB
-            CONNECTIONMODE=AUTOCONNECT
-            """
-        else:
-            config += """
-            PBI=SIM
-            """
-
-        config = "\n".join([x.strip() for x in config.strip().splitlines()])
-        config = config.strip() + "\n"
-
-        replacements = {
-            "T32DIR": self.t32dir,
-            "TMPDIR": self.tempdir,
-            "PORT": self.port,
-        }
+            parts.append(_CONFIG_HEADLESS)
 
-        for key in replacements:
-            config = config.replace(f"@{key}@", str(replacements[key]))
+        parts.append(_CONFIG_USB if podbus == Podbus.USB else _CONFIG_SIM)
 
-        return config
+        values = {
+            "t32dir": self.t32dir,
+            "tmpdir": self.tempdir,
+            "port": self.port,
+        }
+
+        return "\n\n".join(parts).format_map(values) + "\n"
 
     def stop(self, wait_kill=5):
         """ Shuts down trace32 by sending SIGTERM to the subprocess, followed
@@ -427,9 +498,9 @@ class Trace32Subprocess:
             sys.stderr.write(msg)
 
         self.popen.terminate()
-        timeout = time.time() + wait_kill
+        timeout = time.monotonic() + wait_kill
 
-        while time.time() < timeout:
+        while time.monotonic() < timeout:
             self.popen.poll()
             if self.popen.returncode is not None:
                 return self.popen.returncode
@@ -439,8 +510,8 @@ class Trace32Subprocess:
 
         sys.stderr.write(f"Issued SIGKILL to {progname}.\n")
 
-        timeout = time.time() + wait_kill
-        while time.time() < timeout:
+        timeout = time.monotonic() + wait_kill
+        while time.monotonic() < timeout:
             self.popen.poll()
             if self.popen.returncode is not None:
                 return self.popen.returncode
@@ -457,14 +528,8 @@ class Trace32Subprocess:
 
         cmd = [self.t32bin, "-c", self.config_file]
 
-        if 'CREATE_NEW_PROCESS_GROUP' in dir(sp):
-            flag = sp.__dict__['CREATE_NEW_PROCESS_GROUP']
-            extra_arg = {'creationflags': flag}
-        else:
-            extra_arg = {"start_new_session": True}
-
         self._dummy_socket.close()
-        self.popen = ThreadedPopen(cmd, **extra_arg)
+        self.popen = ThreadedPopen(cmd, **_POPEN_DETACH)
         register_cleanup(self.popen.kill)
 
 
@@ -2,26 +2,30 @@
 """CLI utility for launching and controlling a Trace32 instance to do useful
 things."""
 
+from __future__ import annotations
+
 import argparse
 import sys
-import re
 import os
 import io
 import time
+import queue
+import threading
+import contextlib
+import functools
 
-from .t32run import usb_reset, Trace32Subprocess
-from .t32run import find_trace32_dir, find_trace32_bin, Podbus
-
-from .t32iface import Trace32Interface
+# The t32run/t32iface modules (and the ctypes machinery they drag in) are
+# imported lazily at the points that need them, so that --help and parse
+# errors don't pay for them.
 
 # --------------------------------------------------------------------------- #
 
 
 def read(args, iface: Trace32Interface):
     """ Routine for reading data from the target's memory, and writing to
-    stdout or to an outfile. """
+    stdout or to an outfile. Blocks are handed to a background writer
+    thread, so the next API read overlaps with writing out the last one. """
 
-    outfile = None
     received = 0
 
     if args.reference:
@@ -29,23 +33,73 @@ def read(args, iface: Trace32Interface):
     else:
         length = args.count
 
-    while received < length:
-        chunksize = min(args.blocksize, length - received)
-        block = iface.read_memory(args.address + received, chunksize)
-        assert len(block) == chunksize
+    if length <= 0:
+        return
+
+    if args.outfile is None:
+        outfile = sys.stdout.buffer
+    else:
+        # A large write buffer keeps partial chunks (and any unaligned
+        # head/tail blocks) from turning into small syscalls.
+        # pylint: disable=consider-using-with
+        outfile = open(args.outfile, 'wb', buffering=2**20)
+
+    blocks = queue.Queue(maxsize=2)
+    errors = []
+
+    def _writer():
+        # pylint: disable=missing-docstring,broad-except
+        while True:
+            block = blocks.get()
+            if not block:
+                break
+
+            if errors:
+                # Keep draining after a failure so the producer can never
+                # block against the full queue; the first error gets
+                # re-raised on the main thread.
+                continue
+
+            try:
+                outfile.write(block)
+            except Exception as exc:
+                errors.append(exc)
+
+    writer = threading.Thread(target=_writer)
+    writer.start()
+
+    base = args.address
+    blocksize = args.blocksize
+    read_memory = iface.read_memory
+    enqueue = blocks.put
 
-        if outfile is None:
-            if args.outfile is None:
-                outfile = sys.stdout.buffer
-            else:
-                # pylint: disable=consider-using-with
-                outfile = open(args.outfile, 'wb')
+    try:
+        while received < length and not errors:
+            address = base + received
+            chunksize = min(blocksize, length - received)
+
+            # Trim the first chunk (if needed) so that every following
+            # chunk starts on a blocksize-aligned address. Aligned bulk
+            # transfers behave better through the Trace32 back-end.
+
+            misalign = address % blocksize
+            if misalign:
+                chunksize = min(chunksize, blocksize - misalign)
+
+            block = read_memory(address, chunksize)
+            assert len(block) == chunksize
+
+            enqueue(block)
+            received += chunksize
+    finally:
+        blocks.put(b'')
+        writer.join()
 
-        outfile.write(block)
-        received += chunksize
+        if args.outfile is not None:
+            outfile.close()
 
-    if args.outfile is not None:
-        outfile.close()
+    if errors:
+        raise errors[0]
 
 
 def _write_api(args, iface: Trace32Interface):
@@ -180,11 +234,18 @@ def create_commenter(verbosity: int, prefix: str = "# ",
     """Returns a function that can be used for standardized logging of messages
     from the CLI. All messages are associated with a verbosity (default 1) that
     gets compared against the commenter's requested verbosity at creation-time.
-    Messages are only printed if the requested verbosity is high enough. """
-
-    def comment(message: str, level: int = 1):
-        if verbosity >= level:
-            dest.write(prefix + message + "\n")
+    Messages are only printed if the requested verbosity is high enough. At
+    verbosity 0 nothing can ever print, so a bare no-op is returned and the
+    per-message comparison disappears entirely. """
+
+    if verbosity <= 0:
+        def comment(message: str, level: int = 1):
+            # pylint: disable=unused-argument
+            pass
+    else:
+        def comment(message: str, level: int = 1):
+            if verbosity >= level:
+                dest.write(prefix + message + "\n")
 
     return comment
 
@@ -194,9 +255,12 @@ def dump_exception(exception, fileobj=sys.stderr):
     from a CLI tool) to fileobj. If fileobj is None, return the string
     instead. of printing it."""
 
-    exception_type = str(type(exception))
-    exception_type = exception_type.split()[-1]
-    exception_type = re.sub("[^A-Za-z0-9_.-]", "", exception_type)
+    cls = type(exception)
+    exception_type = cls.__qualname__
+
+    if cls.__module__ != "builtins":
+        exception_type = f"{cls.__module__}.{exception_type}"
+
     result = f"Error type: {exception_type}\nError: {str(exception)}"
     if fileobj is None:
         return result
@@ -205,49 +269,72 @@ def dump_exception(exception, fileobj=sys.stderr):
     return None
 
 
+# Every size suffix is a power of 1024, so multipliers reduce to shifts.
+MULTIPLIER_SHIFTS = {'k': 10, 'm': 20, 'g': 30, 't': 40, 'p': 50}
+
+HEX_DIGITS = frozenset("0123456789abcdef")
+
+
 def constant(input_string):
     """ Evaluate a string as a numerical constant and return it. Try to convert
-    the string from a number of different formats. """
+    the string from a number of different formats. Type-sniffing is all done
+    with plain str methods; the regex engine never gets involved. """
 
     value = input_string.strip().lower()
 
-    if re.match("^[0-9]+[.]$", value):
-        return int(value[:-1])
+    # Plain decimal and 0x-prefixed hex cover nearly every real-world
+    # input, so convert those directly first.
+
+    if value.isascii() and value.isdigit():
+        return int(value)
+
+    if value.startswith("0x"):
+        try:
+            return int(value, 16)
+        except ValueError:
+            pass
+
+    head, dot, tail = value.partition(".")
+    head_is_digits = head.isascii() and head.isdigit()
 
-    if re.match("^[0-9]*[.][0-9]+$", value):
+    if dot and not tail and head_is_digits:
+        return int(head)
+
+    if dot and tail.isascii() and tail.isdigit() and (not head
+                                                      or head_is_digits):
         return float(value)
 
-    if re.match("^0?[b][10]+$", value):
+    prefix = value[1:] if value.startswith("0") else value
+
+    if prefix[0:1] == "b" and prefix[1:] and not set(prefix[1:]) - {"0", "1"}:
         return int(value, 2)
 
-    if re.match("^0?[x][a-f0-9]+$", value):
+    if prefix[0:1] == "x" and prefix[1:] and not set(prefix[1:]) - HEX_DIGITS:
         return int(value, 16)
 
-    value = re.sub("b$", "", value)
+    if value.endswith("b"):
+        value = value[:-1]
+
+    digits = value.rstrip("kmgtp")
 
-    if not re.match("^[0-9]+[kmgtp]*$", value):
+    if not (digits and digits.isascii() and digits.isdigit()):
         msg = f"[{input_string}] can't be evaluated as a numeric literal"
         raise argparse.ArgumentTypeError(msg)
 
-    mult = 1
-    multipliers = {
-        'k': 1024,
-        'm': 1024 * 1024,
-        'g': 1024 * 1024 * 1024,
-        't': 1024 * 1024 * 1024 * 1024,
-        'p': 1024 * 1024 * 1024 * 1024 * 1024
-    }
+    shift = sum(MULTIPLIER_SHIFTS[x] for x in value[len(digits):])
+    return int(digits) << shift
 
-    while True:
-        for suffix in multipliers:
-            if value.endswith(suffix):
-                mult = mult * multipliers[suffix]
-                value = value[:-1]
-                break
-        else:
-            break
 
-    return int(value) * mult
+@functools.lru_cache(maxsize=None)
+def _locate_t32bin(value):
+    """ Resolve a Trace32 binary name against the local installation. The
+    filesystem hunt is cached, since argparse can end up validating the
+    same name more than once per invocation. """
+
+    from .t32run import find_trace32_dir, find_trace32_bin
+
+    install_dir = find_trace32_dir(value)
+    return find_trace32_bin(value, install_dir)
 
 
 def trace32_binary(input_string):
@@ -257,8 +344,7 @@ def trace32_binary(input_string):
     value = input_string.strip()
 
     try:
-        install_dir = find_trace32_dir(value)
-        find_trace32_bin(value, install_dir)
+        _locate_t32bin(value)
         return value
     except Exception as err:
         sys.stderr.write(f"{str(err)}\n")
@@ -267,112 +353,98 @@ def trace32_binary(input_string):
 
 def path_readable(filename):
     """ Confirms that filename is a file that can be opened and read. Raises
-    an ArgumentError otherwise. """
+    an ArgumentError otherwise. Uses stat/access checks instead of a trial
+    open(), which would touch atimes and cost a file-handle. """
 
-    try:
-        open(filename, 'rb').close()
-    except Exception as err:
-        sys.stderr.write(f"{str(err)}\n")
-        raise argparse.ArgumentError(None, str(err))
+    readable = os.access(filename, os.R_OK)
 
-    return filename
+    if os.path.exists(filename) and readable and not os.path.isdir(filename):
+        return filename
+
+    msg = f"[{filename}] isn't a readable file."
+    sys.stderr.write(f"{msg}\n")
+    raise argparse.ArgumentError(None, msg)
 
 
 def path_writeable(filename):
     """ Confirms that filename is a file that can be opened for writing. Raises
-    an ArgumentError otherwise. """
-
-    try:
-        if os.path.exists(filename):
-            open(filename, "r+b").close()
-        else:
-            open(filename, 'w+b').close()
-            os.remove(filename)
-
-    except Exception as err:
-        sys.stderr.write(f"{str(err)}\n")
-        raise argparse.ArgumentError(None, str(err))
-
-    return filename
-
-
-def modify_add_argument(parent):
-    """ Modifies the add_argument() method of an ArgumentParser argument-parser
-    object to work around a bug in the interaction between argparse.SUPPRESS
-    and the "%(default)s" operator. """
-
-    add_argument = parent.add_argument
+    an ArgumentError otherwise. Uses stat/access checks instead of trial
+    opens, so nonexistent targets no longer get created and deleted. """
 
-    def make_arg(*args, **kwargs):
-        result = add_argument(*args, **kwargs)
-        if result.default == argparse.SUPPRESS:
-            if result.help:
-                result.help = result.help.replace("%(default)s", str(None))
-
-    parent.add_argument = make_arg
-
-
-def make_count(storage: dict, key):
-    """ Creates an argparse action that's based on 'count', except it stores
-    into an externally-provided dict. This ensures that the action works
-    when mixed in-between a subparser and a main parser."""
+    if os.path.exists(filename):
+        ok = not os.path.isdir(filename) and os.access(filename, os.W_OK)
+    else:
+        dirname = os.path.dirname(os.path.abspath(filename))
+        ok = os.path.isdir(dirname) and os.access(dirname, os.W_OK)
 
-    if key not in storage:
-        storage[key] = 0
+    if ok:
+        return filename
 
-    # pylint: disable=protected-access
+    msg = f"[{filename}] isn't a writeable file."
+    sys.stderr.write(f"{msg}\n")
+    raise argparse.ArgumentError(None, msg)
 
-    class GlobalCounter(argparse._CountAction):
-        # pylint: disable=missing-class-docstring,too-few-public-methods
-        def __call__(self, parser, namespace, values, option_string=None):
-            storage[key] += 1
-            setattr(namespace, self.dest, storage[key])
 
-    return GlobalCounter
+class PassthroughSubParsers(argparse._SubParsersAction):
+    """ Subparser action that parses into the original namespace instead of
+    into a throwaway copy. The shared common options all carry SUPPRESS
+    defaults, so nothing in the namespace gets clobbered, and count-style
+    options accumulate correctly across the subcommand boundary. """
+    # pylint: disable=protected-access,too-few-public-methods
 
+    def __call__(self, parser, namespace, values, option_string=None):
+        parser_name = values[0]
+        arg_strings = values[1:]
 
-def make_append(storage: dict, key):
-    """ Creates an argparse action that'sn based on 'append', except it stores
-    into an externally-provided dict. This ensures that the action works
-    when mixed in-between a subparser and a main parser. """
+        if self.dest is not argparse.SUPPRESS:
+            setattr(namespace, self.dest, parser_name)
 
-    if key not in storage:
-        storage[key] = []
+        try:
+            subparser = self._name_parser_map[parser_name]
+        except KeyError:
+            choices = ', '.join(self._name_parser_map)
+            msg = f"unknown parser '{parser_name}' (choices: {choices})"
+            raise argparse.ArgumentError(self, msg) from None
 
-    # pylint: disable=protected-access
-    class GlobalAppender(argparse._AppendAction):
-        # pylint: disable=missing-class-docstring,too-few-public-methods
-        def __call__(self, parser, namespace, values, option_string=None):
-            storage[key].append(values)
-            setattr(namespace, self.dest, storage[key])
+        _, extras = subparser.parse_known_args(arg_strings, namespace)
 
-    return GlobalAppender
+        if extras:
+            vars(namespace).setdefault(argparse._UNRECOGNIZED_ARGS_ATTR, [])
+            getattr(namespace, argparse._UNRECOGNIZED_ARGS_ATTR).extend(extras)
 
 
-def common_options(storage: dict, toplevel: bool = False):
+def common_options():
     """ These options are shared by all commands in the utility. They're used
     to set up the Trace32 instance, or to tear it down/launch a target after
-    programming. """
-
-    argument_default = None if toplevel else argparse.SUPPRESS
+    programming. The parser is built once and shared (via parents=) between
+    the top-level parser and every subparser; defaults are SUPPRESS here so
+    that subparsers never clobber already-parsed values, and run_parser()
+    supplies the real defaults afterwards. """
 
     parser = argparse.ArgumentParser(add_help=False,
-                                     argument_default=argument_default)
+                                     argument_default=argparse.SUPPRESS)
 
     group = parser.add_argument_group(title="common options")
-    modify_add_argument(group)
+
+    # The built-in 'count' action picks up whatever count is already on
+    # the namespace, so it accumulates correctly across the main parser
+    # and subparser as long as the subparser default is SUPPRESS.
 
     group.add_argument("-v", "--verbose", dest="verbosity", help="""Be verbose.
                        Specify multiple times for more verbosity.""",
-                       action=make_count(storage, 'verbose'))
+                       action="count")
+
+    # The stock 'append' action reads any list already on the namespace,
+    # so (like 'count' above) it accumulates correctly across the main
+    # parser and subparser without any external storage.
 
     group.add_argument("-H", "--header", metavar="FILE", type=path_readable,
-                       action=make_append(storage, 'headers'), help="""PRACTICE
+                       action="append", help="""PRACTICE
                        script to run before taking any other action
-                       (default: %(default)s).""", )
+                       (default: None).""", )
 
     group.add_argument("-F", "--footer", metavar="FILE", type=path_readable,
-                       action=make_append(storage, 'footers'), help="""PRACTICE
+                       action="append", help="""PRACTICE
                        script to run after finishing all other actions
                        (default: None).""")
 
@@ -381,30 +453,39 @@ def common_options(storage: dict, toplevel: bool = False):
                         Trace32.""")
 
     group.add_argument("-p", "--protocol", metavar="PROTOCOL", choices=["usb",
-                       "sim"], default="usb", help="""Protocol to use for
+                       "sim"], help="""Protocol to use for
                        communicating with the target. Known protocols are:
                        [usb, sim] (default: usb).""")
 
     group.add_argument("-t", "--t32bin", metavar="TRACE32BIN",
-                       default="t32marm", type=trace32_binary, help="""Trace32
+                       type=trace32_binary, help="""Trace32
                        binary to use. Controls the target architecture
-                       (default: %(default)s).""")
+                       (default: t32marm).""")
 
     return parser
 
 
+_PARSER_CACHE = []
+
+
 def create_parser():
-    """ Generates and returns an argparse instance for the CLI tool. """
-    storage = {}
-    parent_common = [common_options(storage, True)]
-    child_common = [common_options(storage, False)]
+    """ Generates and returns an argparse instance for the CLI tool. The
+    parser is only built once per process; repeat callers get the cached
+    instance. """
+
+    if _PARSER_CACHE:
+        return _PARSER_CACHE[0]
 
-    top_parser = argparse.ArgumentParser(parents=parent_common)
+    child_common = [common_options()]
+
+    top_parser = argparse.ArgumentParser(parents=child_common)
     top_parser.description = """Command-line tool that uses Lauterbach Trace32
     to control a target device."""
 
+
     subparsers = top_parser.add_subparsers(title='Available commands',
                                            dest="subcommand",
+                                           action=PassthroughSubParsers,
                                            metavar="COMMAND",
                                            help="DESCRIPTION")
 
@@ -422,7 +503,7 @@ def create_parser():
 
     parser.add_argument("-b", "--blocksize", help="""Maximum blocksize to use
                         for read operations (default: %(default)s).""",
-                        default="1M", type=constant)
+                        default="4M", type=constant)
 
     parser.add_argument("-o", "--outfile", help="""Output file to write
                         (default: stdout).""", type=path_writeable)
@@ -501,20 +582,27 @@ def create_parser():
     parser = subparsers.add_parser("serve", help="""Run Trace32 as a headless
                                    server""", parents=child_common)
 
+    _PARSER_CACHE.append(top_parser)
     return top_parser
 
 
 def run_parser(parser):
     """ Run the argparse instance, and do any postprocessing that's required
-    on the arguments. """
+    on the arguments. The common options all default to SUPPRESS (see
+    common_options), so anything the user didn't specify gets filled in
+    here instead. """
 
     args = parser.parse_args()
 
-    if args.footer is None:
-        args.footer = []
+    defaults = {'verbosity': 0, 'usb_reset': False, 'protocol': 'usb',
+                'header': [], 'footer': []}
 
-    if args.header is None:
-        args.header = []
+    for key in defaults:
+        if getattr(args, key, None) is None:
+            setattr(args, key, defaults[key])
+
+    if getattr(args, 't32bin', None) is None:
+        args.t32bin = trace32_binary("t32marm")
 
     if (args.subcommand == 'write') and (args.check == 'checksum'):
         if args.scratchpad is None:
@@ -534,6 +622,43 @@ def run_parser(parser):
 # --------------------------------------------------------------------------- #
 
 
+@contextlib.contextmanager
+def log_runtime(log):
+    """ Context-manager that reports the wall-clock runtime of its body
+    through the supplied log function (at verbosity level 3). Replaces the
+    copy/pasted time.monotonic() bookkeeping around every action. """
+
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        stop = time.monotonic()
+        log("(runtime: %.2f sec)" % (stop - start), level=3)
+
+
+def run_scripts(args, iface: Trace32Interface, scripts, label):
+    """ Run a batch of header/footer PRACTICE scripts. Multiple scripts are
+    fused into one wrapper script of DO statements, so the whole batch only
+    costs a single run_file round-trip through the interface. """
+
+    if not scripts:
+        return
+
+    if len(scripts) == 1:
+        args.log(f"Running {label} script [{scripts[0]}].")
+    else:
+        args.log(f"Running {len(scripts)} {label} scripts as one batch.")
+
+    with log_runtime(args.log):
+        if len(scripts) == 1:
+            iface.run_file(scripts[0], logfile=args.logdest)
+        else:
+            lines = [f"DO {os.path.abspath(x)}" for x in scripts] + ["ENDDO"]
+            iface.run_script("\n".join(lines), logfile=args.logdest)
+
+    args.log(f"All {label} scripts completed OK.")
+
+
 def _cli():
     """ Function that implements the CLI. This is made separate from main()
     to allow for standardized exception handling. """
@@ -554,11 +679,8 @@ def _cli():
     if args.subcommand in ['gdb', 'serve']:
         parser.error(f"subcommand [{args.subcommand}] isn't implemented yet.")
 
-    commands = {
-        'read': read,
-        'write': write,
-        'run': run
-    }
+    from .t32run import usb_reset, Trace32Subprocess, Podbus
+    from .t32iface import Trace32Interface
 
     args.progname = parser.prog
 
@@ -579,28 +701,21 @@ def _cli():
         with Trace32Interface(port=proc.port, tempdir=proc.tempdir) as iface:
             args.log("Remote interface connected OK.", level=2)
 
-            for script in args.header:
-                args.log(f"Running header script [{script}].")
-                start = time.monotonic()
-                iface.run_file(script, logfile=args.logdest)
-                stop = time.monotonic()
-                args.log("Header script completed OK.")
-                args.log("(runtime: %.2f sec)" % (stop - start), level=3)
+            run_scripts(args, iface, args.header, "header")
 
             args.log(f"Launching command [{args.subcommand}].", level=2)
-            start = time.monotonic()
-            result = commands[args.subcommand](args, iface)
-            stop = time.monotonic()
+
+            with log_runtime(args.log):
+                if args.subcommand == 'read':
+                    result = read(args, iface)
+                elif args.subcommand == 'write':
+                    result = write(args, iface)
+                else:
+                    result = run(args, iface)
+
             args.log(f"Command [{args.subcommand}] completd OK.", level=2)
-            args.log("(runtime: %.2f sec)" % (stop - start), level=3)
-
-            for script in args.footer:
-                args.log(f"Running footer script [{script}].")
-                start = time.monotonic()
-                iface.run_file(script, logfile=args.logdest)
-                stop = time.monotonic()
-                args.log("Footer script completed OK.")
-                args.log("(runtime: %.2f sec)" % (stop - start), level=3)
+
+            run_scripts(args, iface, args.footer, "footer")
 
         args.log("Disconnected OK.", level=2)
         args.log("Terminating TRACE32.", level=2)